@@ -7,16 +7,28 @@ Optimized for robustness, timezone accuracy, and API stability.
 import os
 import sys
 import json
-import math
 import argparse
+import contextlib
+import functools
 import re
 import time
-from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import requests
-import pytz
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Force line-buffered stdout
-sys.stdout.reconfigure(line_buffering=True)
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locking
+    fcntl = None
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # =============================================================================
 # Configuration & Schema
@@ -32,6 +44,7 @@ CONFIG_SCHEMA = {
     "asset": {"default": "BTC", "type": str},
     "window": {"default": "5m", "type": str},
     "volume_confidence": {"default": True, "type": bool},
+    "max_settled_price": {"default": 0.95, "type": float},
 }
 
 ASSET_SYMBOLS = {"BTC": "BTCUSDT", "ETH": "ETHUSDT", "SOL": "SOLUSDT"}
@@ -40,19 +53,54 @@ ASSET_PATTERNS = {
     "ETH": ["ethereum up or down"],
     "SOL": ["solana up or down"],
 }
+_ASSET_RE = {
+    asset: re.compile("|".join(re.escape(p) for p in pats), re.I)
+    for asset, pats in ASSET_PATTERNS.items()
+}
 COINGECKO_IDS = {"BTC": "bitcoin", "ETH": "ethereum", "SOL": "solana"}
 STATE_FILE = "trading_state.json"
 
+try:
+    _ET_TZ = ZoneInfo("America/New_York")
+except ZoneInfoNotFoundError as e:  # Windows has no system tz database
+    raise ZoneInfoNotFoundError(
+        "No time zone data for America/New_York; install it with: pip install tzdata"
+    ) from e
+_MONTHS = {
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6,
+    "july": 7, "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+}
+_ET_RE = re.compile(r'(\w+ \d+),.*?-\s*(\d{1,2}:\d{2}(?:AM|PM))\s*ET')
+
+# Shared session so repeated calls to the same hosts reuse keep-alive connections
+_SESSION = requests.Session()
+_RETRY = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    respect_retry_after_header=True,
+    allowed_methods=["GET", "POST"],
+)
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_RETRY))
+
 # =============================================================================
 # Core Utilities
 # =============================================================================
 
+_CFG_CACHE = {"path": None, "mtime": None, "cfg": {}}
+
 def load_config(path="config.json"):
     config = {}
     if os.path.exists(path):
         try:
-            with open(path, 'r') as f:
-                config = json.load(f)
+            # Re-parse only when the file changed since the last call
+            mtime = os.stat(path).st_mtime
+            if _CFG_CACHE["path"] == path and _CFG_CACHE["mtime"] == mtime:
+                config = _CFG_CACHE["cfg"]
+            else:
+                with open(path, 'rb') as f:
+                    config = _json_loads(f.read())
+                _CFG_CACHE.update(path=path, mtime=mtime, cfg=config)
         except Exception as e:
             print(f"Warning: Failed to load config.json: {e}")
     
@@ -68,47 +116,71 @@ def get_api_key():
         sys.exit(1)
     return key
 
-def api_request(url, method="GET", data=None, headers=None, params=None, retries=3):
-    """Robust API request handler with retries."""
-    for i in range(retries):
+def api_request(url, method="GET", data=None, headers=None, params=None):
+    """Robust API request handler; retries and backoff live on the session adapter."""
+    try:
+        response = _SESSION.request(
+            method=method,
+            url=url,
+            json=data,
+            headers=headers,
+            params=params,
+            timeout=15
+        )
+        response.raise_for_status()
+        return _json_loads(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return {"error": str(e)}
+
+@contextlib.contextmanager
+def state_lock():
+    """Hold an exclusive advisory lock around a STATE_FILE read-modify-write."""
+    if fcntl is None:
+        yield
+        return
+    with open(STATE_FILE + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                json=data,
-                headers=headers,
-                params=params,
-                timeout=15
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            if i == retries - 1:
-                return {"error": str(e)}
-            time.sleep(1 * (i + 1))
-    return {"error": "Max retries exceeded"}
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def save_state(state):
+    """Write state via a temp file so an interrupted write never truncates it."""
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, STATE_FILE)
 
 # =============================================================================
 # Market Discovery & Parsing
 # =============================================================================
 
+@functools.lru_cache(maxsize=512)
 def parse_et_to_utc(question):
     """Accurately parse ET time to UTC handling Daylight Saving Time."""
-    pattern = r'(\w+ \d+),.*?-\s*(\d{1,2}:\d{2}(?:AM|PM))\s*ET'
-    match = re.search(pattern, question)
+    match = _ET_RE.search(question)
     if not match:
         return None
     try:
-        date_str = match.group(1)
+        month_name, day = match.group(1).split()
         time_str = match.group(2)
         year = datetime.now(timezone.utc).year
-        dt_str = f"{date_str} {year} {time_str}"
-        
-        # Use pytz for reliable ET conversion
-        et_tz = pytz.timezone("US/Eastern")
-        local_dt = datetime.strptime(dt_str, "%B %d %Y %I:%M%p")
-        localized_dt = et_tz.localize(local_dt)
-        return localized_dt.astimezone(pytz.UTC)
+
+        # Hand-rolled "%B %d %I:%M%p" parse; strptime is far slower
+        hour, minute = time_str[:-2].split(":")
+        hour = int(hour) % 12
+        if time_str[-2:] == "PM":
+            hour += 12
+
+        # zoneinfo resolves the correct EST/EDT offset for the given date.
+        # Times skipped or repeated by a DST change resolve to EST, matching
+        # pytz's localize(is_dst=False): fold=1 picks EST for repeated times,
+        # fold=0 picks it for skipped ones.
+        local_dt = datetime(year, _MONTHS[month_name.lower()], int(day), hour, int(minute), tzinfo=_ET_TZ, fold=1)
+        if local_dt.dst():
+            local_dt = local_dt.replace(fold=0)
+        return local_dt.astimezone(timezone.utc)
     except Exception as e:
         print(f"Time parse error: {e}")
         return None
@@ -121,28 +193,41 @@ def discover_markets(asset="BTC", window="5m"):
     if "error" in result or not isinstance(result, list):
         return []
 
-    patterns = ASSET_PATTERNS.get(asset, ASSET_PATTERNS["BTC"])
+    asset_re = _ASSET_RE.get(asset, _ASSET_RE["BTC"])
+    window_tag = f"-{window}-"
     markets = []
     for m in result:
-        q = (m.get("question") or "").lower()
+        # Cheap slug check first rejects most rows before touching the question
         slug = m.get("slug", "")
-        if any(p in q for p in patterns) and f"-{window}-" in slug:
-            end_time = parse_et_to_utc(m.get("question", ""))
-            if end_time:
-                markets.append({
-                    "question": m.get("question"),
-                    "slug": slug,
-                    "condition_id": m.get("conditionId"),
-                    "end_time": end_time,
-                    "outcome_prices": json.loads(m.get("outcomePrices", "[0.5, 0.5]")),
-                    "fee_rate_bps": int(m.get("feeRateBps") or 0)
-                })
+        if window_tag not in slug:
+            continue
+        if not asset_re.search(m.get("question") or ""):
+            continue
+        end_time = parse_et_to_utc(m.get("question", ""))
+        if end_time:
+            markets.append({
+                "question": m.get("question"),
+                "slug": slug,
+                "condition_id": m.get("conditionId"),
+                "end_time": end_time,
+                "outcome_prices": _json_loads(m.get("outcomePrices", "[0.5, 0.5]")),
+                "fee_rate_bps": int(m.get("feeRateBps") or 0)
+            })
     return markets
 
 # =============================================================================
 # Signal Generation
 # =============================================================================
 
+def volume_stats(candles):
+    """Return (average volume, last volume) over Binance kline rows."""
+    total_vol = 0.0
+    last_vol = 0.0
+    for c in candles:
+        last_vol = float(c[5])
+        total_vol += last_vol
+    return total_vol / len(candles), last_vol
+
 def get_binance_momentum(asset, lookback):
     symbol = ASSET_SYMBOLS.get(asset, "BTCUSDT")
     url = "https://api.binance.com/api/v3/klines"
@@ -156,9 +241,8 @@ def get_binance_momentum(asset, lookback):
     price_now = float(candles[-1][4])
     momentum_pct = ((price_now - price_then) / price_then) * 100
     
-    volumes = [float(c[5]) for c in candles]
-    avg_vol = sum(volumes) / len(volumes)
-    vol_ratio = volumes[-1] / avg_vol if avg_vol > 0 else 1.0
+    avg_vol, last_vol = volume_stats(candles)
+    vol_ratio = last_vol / avg_vol if avg_vol > 0 else 1.0
 
     return {
         "momentum_pct": momentum_pct,
@@ -167,37 +251,55 @@ def get_binance_momentum(asset, lookback):
         "volume_ratio": vol_ratio
     }
 
-def get_coingecko_momentum(asset):
-    """Improved CoinGecko momentum using local state persistence."""
-    cg_id = COINGECKO_IDS.get(asset, "bitcoin")
-    url = f"https://api.coingecko.com/api/v3/simple/price"
-    params = {"ids": cg_id, "vs_currencies": "usd"}
+def get_coingecko_momentum(assets):
+    """Improved CoinGecko momentum using local state persistence.
+
+    Prices for all requested assets are fetched in one /simple/price call
+    to stay within CoinGecko's rate limit. Returns {asset: signal}.
+    """
+    cg_ids = {asset: COINGECKO_IDS.get(asset, "bitcoin") for asset in assets}
+    url = "https://api.coingecko.com/api/v3/simple/price"
+    params = {"ids": ",".join(sorted(set(cg_ids.values()))), "vs_currencies": "usd"}
     res = api_request(url, params=params)
     
-    if "error" in res: return None
-    price_now = res.get(cg_id, {}).get("usd")
-    if not price_now: return None
-
-    # Load previous state
-    state = {}
-    if os.path.exists(STATE_FILE):
-        with open(STATE_FILE, 'r') as f:
-            state = json.load(f)
-    
-    prev_price = state.get(f"{asset}_last_price", price_now)
-    momentum_pct = ((price_now - prev_price) / prev_price) * 100 if prev_price else 0
-    
-    # Update state
-    state[f"{asset}_last_price"] = price_now
-    with open(STATE_FILE, 'w') as f:
-        json.dump(state, f)
+    if "error" in res: return {}
 
-    return {
-        "momentum_pct": momentum_pct,
-        "direction": "up" if momentum_pct > 0 else "down" if momentum_pct < 0 else "neutral",
-        "price_now": price_now,
-        "volume_ratio": 1.0
-    }
+    signals = {}
+    dirty = False
+    with state_lock():
+        # Load previous state
+        state = {}
+        if os.path.exists(STATE_FILE):
+            with open(STATE_FILE, 'r') as f:
+                state = json.load(f)
+        
+        for asset, cg_id in cg_ids.items():
+            price_now = res.get(cg_id, {}).get("usd")
+            if not price_now: continue
+
+            prev_price = state.get(f"{asset}_last_price", price_now)
+            momentum_pct = ((price_now - prev_price) / prev_price) * 100 if prev_price else 0
+            
+            # Update state; unchanged prices need no rewrite
+            if price_now != prev_price or f"{asset}_last_price" not in state:
+                state[f"{asset}_last_price"] = price_now
+                dirty = True
+            signals[asset] = {
+                "momentum_pct": momentum_pct,
+                "direction": "up" if momentum_pct > 0 else "down" if momentum_pct < 0 else "neutral",
+                "price_now": price_now,
+                "volume_ratio": 1.0
+            }
+
+        if dirty:
+            save_state(state)
+
+    return signals
+
+def get_signal(cfg):
+    if cfg['signal_source'] == "binance":
+        return get_binance_momentum(cfg['asset'], cfg['lookback_minutes'])
+    return get_coingecko_momentum([cfg['asset']]).get(cfg['asset'])
 
 # =============================================================================
 # Execution Logic
@@ -207,22 +309,27 @@ def run_strategy(args, cfg):
     print(f"🚀 Running Improved Strategy for {cfg['asset']}...")
     api_key = get_api_key()
     
-    markets = discover_markets(cfg['asset'], cfg['window'])
-    now = datetime.now(timezone.utc)
-    valid_markets = [m for m in markets if (m['end_time'] - now).total_seconds() > cfg['min_time_remaining']]
+    # Market discovery and the price signal are independent network calls
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_markets = ex.submit(discover_markets, cfg['asset'], cfg['window'])
+        f_signal = ex.submit(get_signal, cfg)
+        markets = f_markets.result()
+        signal = f_signal.result()
+
+    cutoff_ts = time.time() + cfg['min_time_remaining']
+    valid_markets = [m for m in markets if m['end_time'].timestamp() > cutoff_ts]
     
     if not valid_markets:
         print("No suitable markets found.")
         return
 
-    best = sorted(valid_markets, key=lambda x: x['end_time'])[0]
+    best = min(valid_markets, key=lambda x: x['end_time'])
     print(f"Target: {best['question']}")
 
-    # Get Signal
-    if cfg['signal_source'] == "binance":
-        signal = get_binance_momentum(cfg['asset'], cfg['lookback_minutes'])
-    else:
-        signal = get_coingecko_momentum(cfg['asset'])
+    prices = [float(p) for p in best['outcome_prices']]
+    if prices and max(prices) > cfg['max_settled_price']:
+        print("Market already decided by the orderbook, skipping.")
+        return
 
     if not signal:
         print("Failed to get price signal.")